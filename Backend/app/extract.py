@@ -5,7 +5,7 @@ import os
 import json
 import tempfile
 import asyncio
-from typing import List, Dict
+from typing import AsyncIterator, List, Dict, Tuple
 import pymupdf
 from mistralai import Mistral
 from fastapi.responses import FileResponse
@@ -15,8 +15,8 @@ from app.misteralai_service import get_chat_response, get_chat_response_async, o
 client = Mistral(api_key=os.getenv("MISTRAL_API_KEY"))
 
 
-async def get_fields_with_positions_async(pa_pdf_bytes: bytes) -> List[Dict]:
-    """Extract PA form fields with their type, page number, position, and label."""
+def scan_fields(pa_pdf_bytes: bytes) -> List[Dict]:
+    """Read PA form widgets (name, type, page, position, label) without AI descriptions."""
     doc = pymupdf.open(stream=pa_pdf_bytes, filetype="pdf")
     fields = []
     for page_index in range(len(doc)):
@@ -35,90 +35,85 @@ async def get_fields_with_positions_async(pa_pdf_bytes: bytes) -> List[Dict]:
             )
             w = w.next
     doc.close()
+    return fields
+
 
+async def get_fields_with_positions_async(pa_pdf_bytes: bytes) -> List[Dict]:
+    """Extract PA form fields with their type, page number, position, and label."""
+    fields = scan_fields(pa_pdf_bytes)
     fields_with_details = await get_fields_details_async(fields=fields, pdf_bytes=pa_pdf_bytes)
     return fields_with_details
 
 
 def get_fields_with_positions(pa_pdf_bytes: bytes) -> List[Dict]:
     """Extract PA form fields with their type, page number, position, and label."""
-    doc = pymupdf.open(stream=pa_pdf_bytes, filetype="pdf")
-    fields = []
-    for page_index in range(len(doc)):
-        page = doc[page_index]
-        w = page.first_widget
-        while w:
-            fields.append(
-                {
-                    "name": w.field_name,
-                    "type": w.field_type_string,
-                    "page": page_index + 1,
-                    "bbox": tuple(w.rect),  # (x0, y0, x1, y1)
-                    "label": w.field_label or "",
-                    "description": "",
-                }
-            )
-            w = w.next
-    doc.close()
-
+    fields = scan_fields(pa_pdf_bytes)
     fields_with_details = get_fields_details(fields=fields, pdf_bytes=pa_pdf_bytes)
     return fields_with_details
 
 
+def split_field_groups(fields: List[Dict], size: int = 20) -> List[List[Dict]]:
+    """Split fields into groups of at most `size` for concurrent description requests."""
+    return [fields[i:i + size] for i in range(0, len(fields), size)]
+
+
+async def describe_field_group_async(group_index: int, field_group: List[Dict], pages_list: List[str]) -> List[Dict]:
+    """Ask Mistral to fill the description of each field in one group."""
+    import time
+    group_start = time.time()
+    print(f"Starting processing for group {group_index + 1} with {len(field_group)} fields")
+
+    # Get all page content for this group
+    pages_content = []
+    for field in field_group:
+        page_num = field["page"]
+        if page_num <= len(pages_list):
+            page_content = pages_list[page_num - 1]
+            if page_content not in pages_content:
+                pages_content.append(page_content)
+
+    # Combine relevant page content
+    combined_content = "\n\n".join(pages_content)
+
+    chat_input = (
+        f"Prior Authorization document fields (Group {group_index + 1}):\n{json.dumps(field_group, indent=2)}\n\n"
+        f"Document content:\n{combined_content[:300]}...\n\n"
+        "Please return a JSON array of fields as is with filling the description value with the meaningful short description based on this specific page. The output should be a valid JSON array."
+    )
+
+    resp = await get_chat_response_async(chat_input)
+
+    group_end = time.time()
+    print(f"Completed group {group_index + 1} in {group_end - group_start:.2f} seconds")
+
+    try:
+        content = resp.choices[0].message.content
+        # Extract JSON from within the markdown code block if present
+        start = content.find('[')
+        end = content.rfind(']')
+        if start != -1 and end != -1:
+            json_str = content[start:end+1]
+            return json.loads(json_str)
+        else:
+            raise ValueError("No JSON array found in response")
+    except (json.JSONDecodeError, ValueError) as e:
+        raise ValueError(
+            f"Invalid JSON from Mistral: {e}\n" + resp.choices[0].message.content
+        )
+
+
 async def get_fields_details_async(fields: List[Dict], pdf_bytes: bytes):
     import time
     start_time = time.time()
     
-    # Get all pages as a list
-    pages_list = ocr_markdown_pages_list(pdf_bytes)
+    # Get all pages as a list (OCR is a blocking call, keep the event loop free)
+    pages_list = await asyncio.to_thread(ocr_markdown_pages_list, pdf_bytes)
     
     # Split fields into groups of maximum 20
-    field_groups = [fields[i:i + 20] for i in range(0, len(fields), 20)]
-    
-    async def process_field_group(group_index, field_group):
-        group_start = time.time()
-        print(f"Starting processing for group {group_index + 1} with {len(field_group)} fields")
-        
-        # Get all page content for this group
-        pages_content = []
-        for field in field_group:
-            page_num = field["page"]
-            if page_num <= len(pages_list):
-                page_content = pages_list[page_num - 1]
-                if page_content not in pages_content:
-                    pages_content.append(page_content)
-        
-        # Combine relevant page content
-        combined_content = "\n\n".join(pages_content)
-        
-        chat_input = (
-            f"Prior Authorization document fields (Group {group_index + 1}):\n{json.dumps(field_group, indent=2)}\n\n"
-            f"Document content:\n{combined_content[:300]}...\n\n"
-            "Please return a JSON array of fields as is with filling the description value with the meaningful short description based on this specific page. The output should be a valid JSON array."
-        )
-
-        resp = await get_chat_response_async(chat_input)
-        
-        group_end = time.time()
-        print(f"Completed group {group_index + 1} in {group_end - group_start:.2f} seconds")
-
-        try:
-            content = resp.choices[0].message.content
-            # Extract JSON from within the markdown code block if present
-            start = content.find('[')
-            end = content.rfind(']')
-            if start != -1 and end != -1:
-                json_str = content[start:end+1]
-                return json.loads(json_str)
-            else:
-                raise ValueError("No JSON array found in response")
-        except (json.JSONDecodeError, ValueError) as e:
-            raise ValueError(
-                f"Invalid JSON from Mistral: {e}\n" + resp.choices[0].message.content
-            )
+    field_groups = split_field_groups(fields)
     
     # Process all field groups concurrently
-    tasks = [process_field_group(i, group) for i, group in enumerate(field_groups)]
+    tasks = [describe_field_group_async(i, group, pages_list) for i, group in enumerate(field_groups)]
     print(f"Starting {len(tasks)} concurrent tasks for {len(field_groups)} groups")
     
     results = await asyncio.gather(*tasks)
@@ -179,6 +174,13 @@ def process_referral(
     Context includes PA form structure and referral text.
     """
     referral_pages = ocr_markdown_pages(referral_pdf_bytes)
+    return map_referral_values(pa_fields, referral_pages)
+
+
+def map_referral_values(
+    pa_fields: List[Dict], referral_pages: Dict[int, str]
+) -> Dict[str, str]:
+    """Extract each PA field value from already OCR'd referral pages via Mistral Chat."""
     referral_text = "\n\n".join(referral_pages.values())[:2000]
 
     chat_input = (
@@ -270,18 +272,25 @@ def fill_pa(pa_pdf_bytes: bytes, filled_data: Dict[str, str]) -> str:
     return tmp_path
 
 
-async def process_files_async(pa_pdf_bytes: bytes, referral_pdf_bytes: bytes) -> FileResponse:
+async def fill_files_async(pa_pdf_bytes: bytes, referral_pdf_bytes: bytes) -> Tuple[Dict[str, str], str]:
     """
-    Full workflow (async version):
+    Full workflow (async version), without the HTTP response:
     1. Extract PA field metadata
     2. OCR PA to get context
     3. OCR referral + use Mistral Chat to extract values
     4. Fill PA PDF
-    5. Return the filled PA as FileResponse
+    5. Return the extracted values and the filled PA path
     """
     fields = await get_fields_with_positions_async(pa_pdf_bytes)
-    filled_data = process_referral(fields, referral_pdf_bytes)
-    filled_path = fill_pa(pa_pdf_bytes, filled_data)
+    # Blocking Mistral and PDF calls run in threads so several pairs can share a loop
+    filled_data = await asyncio.to_thread(process_referral, fields, referral_pdf_bytes)
+    filled_path = await asyncio.to_thread(fill_pa, pa_pdf_bytes, filled_data)
+    return filled_data, filled_path
+
+
+async def process_files_async(pa_pdf_bytes: bytes, referral_pdf_bytes: bytes) -> FileResponse:
+    """Run the full async workflow and return the filled PA as FileResponse."""
+    _, filled_path = await fill_files_async(pa_pdf_bytes, referral_pdf_bytes)
     return FileResponse(
         filled_path,
         media_type="application/pdf",
@@ -290,6 +299,62 @@ async def process_files_async(pa_pdf_bytes: bytes, referral_pdf_bytes: bytes) ->
     )
 
 
+async def process_files_events(pa_pdf_bytes: bytes, referral_pdf_bytes: bytes) -> AsyncIterator[Dict]:
+    """
+    Full workflow as a stream of stage events:
+    1. "fields_scanned" once the PA widgets are read
+    2. "ocr_pages" for the PA and the referral as each OCR call finishes
+    3. "field_descriptions" for every field group as soon as it is described
+    4. "field_values" with the values extracted from the referral
+    5. "filled" with the path of the filled PA PDF
+    """
+    fields = scan_fields(pa_pdf_bytes)
+    yield {"event": "fields_scanned", "count": len(fields)}
+
+    # The referral OCR does not depend on the PA, run it alongside
+    referral_task = asyncio.create_task(asyncio.to_thread(ocr_markdown_pages, referral_pdf_bytes))
+    group_tasks: Dict[asyncio.Task, int] = {}
+    try:
+        pages_list = await asyncio.to_thread(ocr_markdown_pages_list, pa_pdf_bytes)
+        yield {"event": "ocr_pages", "document": "pa", "pages": len(pages_list)}
+
+        field_groups = split_field_groups(fields)
+        for i, group in enumerate(field_groups):
+            group_tasks[asyncio.create_task(describe_field_group_async(i, group, pages_list))] = i
+
+        described: Dict[int, List[Dict]] = {}
+        pending = set(group_tasks) | {referral_task}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task is referral_task:
+                    referral_pages = task.result()
+                    yield {"event": "ocr_pages", "document": "referral", "pages": len(referral_pages)}
+                    continue
+                group_index = group_tasks[task]
+                described[group_index] = task.result()
+                yield {
+                    "event": "field_descriptions",
+                    "group": group_index + 1,
+                    "groups": len(field_groups),
+                    "fields": described[group_index],
+                }
+        fields_with_details = [field for i in sorted(described) for field in described[i]]
+    finally:
+        # On a failed group or a closed stream, stop spending Mistral quota on the rest
+        for task in [referral_task, *group_tasks]:
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                task.exception()  # mark as retrieved so asyncio does not log it again
+
+    filled_data = await asyncio.to_thread(map_referral_values, fields_with_details, referral_pages)
+    yield {"event": "field_values", "values": filled_data}
+
+    filled_path = await asyncio.to_thread(fill_pa, pa_pdf_bytes, filled_data)
+    yield {"event": "filled", "path": filled_path}
+
+
 def process_files(pa_pdf_bytes: bytes, referral_pdf_bytes: bytes) -> FileResponse:
     """
     Full workflow:
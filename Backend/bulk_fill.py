@@ -0,0 +1,277 @@
+# bulk_fill.py
+"""
+Offline bulk PA filling.
+
+Discovers PA/referral pairs laid out like `Input Data/<patient>/PA.pdf` +
+`Input Data/<patient>/referral_package.pdf`, fills every PA and writes the
+filled PDF and the extracted values next to a `manifest.jsonl` in the output
+directory. Each item is recorded in the manifest as soon as it finishes, and
+items whose outputs already exist are skipped, so a crashed run can simply be
+started again.
+
+Usage (from the Backend folder):
+    python bulk_fill.py "../Input Data" --out ../output --workers 4 --concurrency 4
+"""
+
+import os
+import re
+import json
+import time
+import queue
+import shutil
+import asyncio
+import argparse
+import multiprocessing
+from typing import Dict, List, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MANIFEST_NAME = "manifest.jsonl"
+DEFAULT_PA_PATTERN = r"pa\d*"
+DEFAULT_REFERRAL_PATTERN = r".*referral.*"
+
+
+def discover_pairs(
+    input_dir: str,
+    pa_pattern: str = DEFAULT_PA_PATTERN,
+    referral_pattern: str = DEFAULT_REFERRAL_PATTERN,
+) -> List[Dict]:
+    """
+    Find PA/referral pairs. In each folder, PDFs whose file stem fully matches
+    `referral_pattern` are referral packages and those matching `pa_pattern` are
+    PA forms (both case-insensitive); every PA form is paired with the folder's
+    single referral package.
+    """
+    pa_re = re.compile(pa_pattern, re.IGNORECASE)
+    referral_re = re.compile(referral_pattern, re.IGNORECASE)
+
+    pairs = []
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
+        pdfs = sorted(f for f in files if f.lower().endswith(".pdf"))
+        referrals = [f for f in pdfs if referral_re.fullmatch(os.path.splitext(f)[0])]
+        pa_forms = [f for f in pdfs if pa_re.fullmatch(os.path.splitext(f)[0]) and f not in referrals]
+        if not pa_forms:
+            continue
+        if len(referrals) != 1:
+            print(f"Skipping {root}: expected 1 referral PDF, found {len(referrals)}")
+            continue
+
+        rel_dir = os.path.relpath(root, input_dir)
+        for pa_name in pa_forms:
+            item_id = os.path.normpath(os.path.join(rel_dir, os.path.splitext(pa_name)[0]))
+            pairs.append(
+                {
+                    "id": item_id.replace(os.sep, "/"),
+                    "pa": os.path.join(root, pa_name),
+                    "referral": os.path.join(root, referrals[0]),
+                }
+            )
+    return pairs
+
+
+def load_manifest(manifest_path: str) -> Dict[str, Dict]:
+    """Return the latest manifest record per item id."""
+    records = {}
+    if not os.path.exists(manifest_path):
+        return records
+    with open(manifest_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash can leave a partial last line behind
+                continue
+            records[record["id"]] = record
+    return records
+
+
+def output_paths(item: Dict, out_dir: str) -> Tuple[str, str]:
+    base = os.path.join(out_dir, *item["id"].split("/"))
+    return base + ".filled.pdf", base + ".json"
+
+
+def is_finished(item: Dict, out_dir: str) -> bool:
+    # Outputs are only ever moved into place complete, so their presence means the
+    # item finished even if the run crashed before its manifest record was written
+    return all(os.path.exists(path) for path in output_paths(item, out_dir))
+
+
+async def fill_item(item: Dict, out_dir: str) -> Dict:
+    from app.extract import fill_files_async
+
+    start_time = time.time()
+    filled_pdf, extracted_json = output_paths(item, out_dir)
+    record = {**item, "filled_pdf": filled_pdf, "extracted_json": extracted_json}
+    filled_path = None
+
+    try:
+        with open(item["pa"], "rb") as f:
+            pa_bytes = f.read()
+        with open(item["referral"], "rb") as f:
+            referral_bytes = f.read()
+
+        filled_data, filled_path = await fill_files_async(pa_bytes, referral_bytes)
+
+        # Write through temporary names so a crash never leaves a half-written output
+        os.makedirs(os.path.dirname(filled_pdf), exist_ok=True)
+        shutil.move(filled_path, filled_pdf + ".tmp")
+        os.replace(filled_pdf + ".tmp", filled_pdf)
+        with open(extracted_json + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(filled_data, f, indent=2)
+        os.replace(extracted_json + ".tmp", extracted_json)
+
+        record["status"] = "done"
+    except Exception as e:
+        record["status"] = "failed"
+        record["error"] = str(e)
+    finally:
+        for leftover in (filled_path, filled_pdf + ".tmp", extracted_json + ".tmp"):
+            if leftover and os.path.exists(leftover):
+                os.remove(leftover)
+
+    record["seconds"] = round(time.time() - start_time, 2)
+    return record
+
+
+def run_worker(items: List[Dict], out_dir: str, concurrency: int, results: multiprocessing.Queue):
+    """
+    Worker process entry point: fill its items on a single event loop (the Mistral
+    client's async connections stay bound to it), with at most `concurrency` in
+    flight, and report each record as soon as the item finishes.
+    """
+
+    async def run_all():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run_one(item):
+            async with semaphore:
+                results.put(await fill_item(item, out_dir))
+
+        await asyncio.gather(*(run_one(item) for item in items))
+
+    asyncio.run(run_all())
+
+
+def bulk_fill(
+    input_dir: str,
+    out_dir: str,
+    workers: int,
+    concurrency: int,
+    pa_pattern: str = DEFAULT_PA_PATTERN,
+    referral_pattern: str = DEFAULT_REFERRAL_PATTERN,
+) -> Dict[str, int]:
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+    records = load_manifest(manifest_path)
+
+    pairs = discover_pairs(input_dir, pa_pattern, referral_pattern)
+    finished = [item for item in pairs if is_finished(item, out_dir)]
+    pending = [item for item in pairs if not is_finished(item, out_dir)]
+    print(f"Found {len(pairs)} pairs, {len(finished)} already done, {len(pending)} to process")
+
+    counts = {"done": 0, "failed": 0, "skipped": len(finished)}
+
+    # Start on a fresh line if a crash cut the last record short
+    cut_short = False
+    if os.path.exists(manifest_path) and os.path.getsize(manifest_path) > 0:
+        with open(manifest_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            cut_short = f.read(1) != b"\n"
+
+    with open(manifest_path, "a", encoding="utf-8") as manifest:
+        if cut_short:
+            manifest.write("\n")
+
+        def write_record(record: Dict):
+            manifest.write(json.dumps(record) + "\n")
+            manifest.flush()
+            os.fsync(manifest.fileno())
+
+        # Record items whose outputs exist but whose manifest entry was lost in a crash
+        for item in finished:
+            if records.get(item["id"], {}).get("status") != "done":
+                filled_pdf, extracted_json = output_paths(item, out_dir)
+                write_record({**item, "filled_pdf": filled_pdf, "extracted_json": extracted_json, "status": "done"})
+
+        if not pending:
+            return counts
+
+        # Spread items round-robin so every worker keeps `concurrency` pairs in flight
+        slices = [pending[i::workers] for i in range(workers) if pending[i::workers]]
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=run_worker, args=(items, out_dir, concurrency, results))
+            for items in slices
+        ]
+        for process in processes:
+            process.start()
+
+        reported = set()
+
+        def handle(record: Dict):
+            reported.add(record["id"])
+            counts[record["status"]] += 1
+            write_record(record)
+            print(f"[{record['status']}] {record['id']}")
+
+        while len(reported) < len(pending):
+            try:
+                handle(results.get(timeout=1))
+            except queue.Empty:
+                if any(process.is_alive() for process in processes):
+                    continue
+                # Every worker has exited; pick up anything still in flight, then stop
+                try:
+                    while True:
+                        handle(results.get(timeout=1))
+                except queue.Empty:
+                    break
+
+        for process in processes:
+            process.join()
+
+        # Items of a worker that died without reporting them
+        for items, process in zip(slices, processes):
+            for item in items:
+                if item["id"] not in reported:
+                    handle({**item, "status": "failed", "error": f"worker exited with code {process.exitcode}"})
+
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill PA forms for every PA/referral pair in a directory tree.")
+    parser.add_argument("input_dir", help="Directory laid out like <patient>/PA.pdf + <patient>/referral*.pdf")
+    parser.add_argument("--out", default="output", help="Output directory for filled PDFs, JSON and the manifest")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of worker processes")
+    parser.add_argument("--concurrency", type=int, default=4, help="Pairs processed concurrently per worker")
+    parser.add_argument(
+        "--pa-pattern", default=DEFAULT_PA_PATTERN, help="Regex a PA form's file stem must fully match (case-insensitive)"
+    )
+    parser.add_argument(
+        "--referral-pattern",
+        default=DEFAULT_REFERRAL_PATTERN,
+        help="Regex a referral PDF's file stem must fully match (case-insensitive)",
+    )
+    args = parser.parse_args()
+
+    if args.workers < 1 or args.concurrency < 1:
+        parser.error("--workers and --concurrency must be at least 1")
+
+    start_time = time.time()
+    counts = bulk_fill(
+        args.input_dir, args.out, args.workers, args.concurrency, args.pa_pattern, args.referral_pattern
+    )
+    print(
+        f"Done: {counts['done']} filled, {counts['failed']} failed, {counts['skipped']} skipped "
+        f"in {time.time() - start_time:.2f} seconds"
+    )
+    if counts["failed"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,18 @@
 import os
+import json
+import time
+import uuid
+import shutil
+import traceback
 from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from app.extract_temp import extract_data
 from app.fill_form import fill_pdf_form, fill_pdf_from_bytes
-from app.extract import process_files_async
+from app.extract import process_files_async, process_files_events
 from dotenv import load_dotenv
 import tempfile
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.background import BackgroundTask
 
 load_dotenv()
 app = FastAPI()
@@ -21,6 +27,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Filled PDFs produced by the streaming endpoint are stored as <download id>.pdf in a
+# directory shared by all workers; unclaimed files are removed after FILLED_PDF_TTL seconds
+FILLED_PDF_DIR = os.getenv("FILLED_PDF_DIR", os.path.join(tempfile.gettempdir(), "filled_pdfs"))
+FILLED_PDF_TTL = int(os.getenv("FILLED_PDF_TTL", "3600"))
+
+
+def remove_expired_filled_pdfs():
+    if not os.path.isdir(FILLED_PDF_DIR):
+        return
+    cutoff = time.time() - FILLED_PDF_TTL
+    for name in os.listdir(FILLED_PDF_DIR):
+        path = os.path.join(FILLED_PDF_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass  # already downloaded or removed by another worker
+
+
+def filled_pdf_path(file_id: str) -> str:
+    return os.path.join(FILLED_PDF_DIR, f"{file_id}.pdf")
+
 @app.post("/retrieve_pdf_ocr_results")
 async def retrieve_pdf_ocr_results(file: UploadFile = File(...)):
     pdf_bytes = await file.read()
@@ -39,3 +67,50 @@ async def process_pdfs(
 
     # Return filled PDF file as a downloadable response
     return await process_files_async(pa_pdf_bytes=pa_bytes, referral_pdf_bytes=referral_bytes)
+
+
+@app.post("/process_pdfs/stream")
+async def process_pdfs_stream(
+    referral_pdf: UploadFile = File(...), pa_pdf: UploadFile = File(...)
+):
+    """Same workflow as /process_pdfs/ but streams stage events as NDJSON lines."""
+    referral_bytes = await referral_pdf.read()
+    pa_bytes = await pa_pdf.read()
+
+    remove_expired_filled_pdfs()
+
+    async def events():
+        try:
+            async for event in process_files_events(pa_pdf_bytes=pa_bytes, referral_pdf_bytes=referral_bytes):
+                if event["event"] == "filled":
+                    # Hand out a download id instead of the server-side path
+                    file_id = uuid.uuid4().hex
+                    os.makedirs(FILLED_PDF_DIR, exist_ok=True)
+                    shutil.move(event["path"], filled_pdf_path(file_id))
+                    event = {"event": "done", "file_id": file_id, "download_url": f"/filled_pdfs/{file_id}"}
+                yield json.dumps(event) + "\n"
+        except Exception as e:
+            # The message can carry the raw model response (and patient data), keep it server-side
+            traceback.print_exc()
+            yield json.dumps({"event": "error", "detail": "Failed to process PDFs", "error_type": type(e).__name__}) + "\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+@app.get("/filled_pdfs/{file_id}")
+async def download_filled_pdf(file_id: str):
+    try:
+        file_id = uuid.UUID(hex=file_id).hex
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Filled PDF not found")
+    filled_path = filled_pdf_path(file_id)
+    if not os.path.exists(filled_path):
+        raise HTTPException(status_code=404, detail="Filled PDF not found")
+    # Download handles are single use, the file is removed once it has been sent
+    return FileResponse(
+        filled_path,
+        media_type="application/pdf",
+        filename="filled_PA.pdf",
+        headers={"Content-Disposition": "attachment; filename=filled_PA.pdf"},
+        background=BackgroundTask(os.remove, filled_path),
+    )